@@ -64,7 +64,7 @@ class FileProcessor:
 
     def extract_text_from_pdf(self, binary_content: bytes) -> str:
         """Extracts text from PDF using PyMuPDF, with OCR fallback if necessary."""
-        extracted_text = ""
+        pages = []
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tempf:
             tempf.write(binary_content)
             temp_path = tempf.name
@@ -77,8 +77,9 @@ class FileProcessor:
                     pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
                     img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
                     text = pytesseract.image_to_string(img)
-                extracted_text += text + "\n"
-            return extracted_text
+                pages.append(text + "\n")
+            # one join at the end instead of re-copying the text on every page
+            return "".join(pages)
         finally:
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
@@ -88,7 +89,7 @@ class FileProcessor:
         Extracts text from PDF with enhanced OCR settings for better quality.
         Always uses OCR on every page with high-quality settings.
         """
-        extracted_text = ""
+        pages = []
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tempf:
             tempf.write(binary_content)
             temp_path = tempf.name
@@ -104,8 +105,8 @@ class FileProcessor:
                 custom_config = r'--oem 3 --psm 6 -l eng'  # OEM 3 = default OCR engine, PSM 6 = assume single uniform block of text
                 text = pytesseract.image_to_string(img, config=custom_config)
                 
-                extracted_text += text + "\n"
-            return extracted_text
+                pages.append(text + "\n")
+            return "".join(pages)
         finally:
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
@@ -2,54 +2,324 @@
 
 import os
 import re
-import json
+import string
 import random
+import pickle
+import sqlite3
 import time
+import hashlib
+import logging
+import threading
 import requests
-from typing import Dict, Any, List, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Callable, Optional
 
+import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+from sklearn.feature_extraction.text import HashingVectorizer
+from rapidfuzz.distance import Levenshtein
+
+log = logging.getLogger(__name__)
 
 import spacy
 nlp = spacy.load("en_core_web_sm")
 
+# Pipeline components each call site can skip (passed as nlp(..., disable=...))
+NOUN_CHUNK_DISABLE = ["lemmatizer", "ner"]
+NER_ONLY_DISABLE = ["tagger", "parser", "attribute_ruler", "lemmatizer"]
+LEMMA_ONLY_DISABLE = ["parser", "ner"]
+
+SEP_TOKEN = "<sep>"
+_SEP_RE = re.compile(re.escape(SEP_TOKEN))
+_NUM_PREFIX_RE = re.compile(r'^\d+\.\s*')
+_LEADING_ARTICLE_RE = re.compile(r'^(a|an|the)\s+')
+# Substring alternations (same semantics as `any(w in text.lower() ...)`), one C-level scan each
+_QUESTION_WORD_RE = re.compile(r"what|why|how|which|where|when")
+_KEY_MARKER_RE = re.compile(r"important|significant|key|main|crucial|essential")
+
+# Stateless (no fit, no vocabulary), so one instance serves every document and thread
+_TERM_VECTORIZER = HashingVectorizer(stop_words='english', n_features=2**18,
+                                     alternate_sign=False, norm='l2')
+
+# OpenRouter limits: concurrent distractor requests and attempts per request (incl. 429 retries)
+LLM_MAX_CONCURRENCY = 8
+LLM_MAX_ATTEMPTS = 3
+# Rate-limit / gateway statuses worth another attempt; waits are 2s, 4s, ... between attempts
+LLM_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LLM_BACKOFF_BASE = 2
+# (connect, read) seconds: fail fast on an unreachable host, still allow a slow (free-tier) completion.
+# A read timeout is never resent and failed connects are re-dialled at most LLM_CONNECT_RETRIES times,
+# so one HTTP attempt takes <= (1 + 1) * 5 + 60 = 70s and one distractor call (LLM_MAX_ATTEMPTS
+# attempts plus 2s + 4s backoff) at worst 3 * 70 + 6 = 216s
+LLM_TIMEOUT = (5, 60)
+LLM_CONNECT_RETRIES = 1
+
+# Prompts per QG / distractor generate() call; prompts are length-sorted so each batch pads tightly
+QG_MICRO_BATCH_SIZE = 8
+DISTRACTOR_MICRO_BATCH_SIZE = 8
+# Beams (and returned sequences) per question for T5 distractor decoding
+T5_DISTRACTOR_SEQUENCES = 5
+
 import nltk
 from nltk.corpus import wordnet as wn
-from nltk.tokenize import sent_tokenize
+from nltk.tokenize import PunktTokenizer
 
 try:
-    nltk.data.find("tokenizers/punkt")
+    nltk.data.find("tokenizers/punkt_tab")
 except LookupError:
-    nltk.download("punkt")
+    nltk.download("punkt_tab")
 try:
     nltk.data.find("corpora/wordnet")
 except LookupError:
     nltk.download("wordnet")
 
+# What sent_tokenize(text) uses for English, built once instead of looked up per call
+_punkt = PunktTokenizer("english")
+
 try:
     from sense2vec import Sense2Vec
-    s2v = Sense2Vec().from_disk("s2v_old")  # Adjust if needed
-    s2v_available = True
-except:
-    s2v = None
-    s2v_available = False
+except ImportError:
+    Sense2Vec = None
+
+S2V_PATH = "s2v_old"  # Adjust if needed
+_s2v_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _load_s2v() -> Optional["Sense2Vec"]:
+    if Sense2Vec is None:
+        return None
+    try:
+        return Sense2Vec().from_disk(S2V_PATH)
+    except Exception as e:
+        log.debug("sense2vec unavailable: %s", e)
+        return None
+
+
+def _get_s2v() -> Optional["Sense2Vec"]:
+    """
+    The sense2vec vectors, loaded on first use rather than at import and kept for the process;
+    None if sense2vec or the vectors are unavailable. Only the sense2vec fallback needs them.
+    """
+    # the lock keeps concurrent first callers from each loading the vectors
+    with _s2v_lock:
+        return _load_s2v()
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+# Parent directory of the on-disk caches (.sbert_cache, .llm_cache); "" disables them
+CACHE_DIR = os.environ.get("MCQ_CACHE_DIR", ".")
+_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _open_cache(name: str) -> Optional["diskcache.Cache"]:
+    if diskcache is None or not CACHE_DIR:
+        return None
+    try:
+        return diskcache.Cache(os.path.join(CACHE_DIR, name))
+    except (OSError, sqlite3.Error) as e:
+        # e.g. a read-only working directory in a container: run without the disk tier
+        log.debug("Disk cache %s unavailable: %s", name, e)
+        return None
+
+def disk_cache(name: str) -> Optional["diskcache.Cache"]:
+    """The named cache under CACHE_DIR, opened on first use; None if diskcache is missing or unwritable."""
+    with _cache_lock:
+        return _open_cache(name)
+
+def content_key(*parts: str) -> str:
+    """Stable cache key for one or more strings."""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+SBERT_MODEL_NAME = "all-MiniLM-L6-v2"
+SBERT_MAX_SEQ_LENGTH = 128
+
+def load_sbert(device: Optional[str] = None) -> SentenceTransformer:
+    """Load the SBERT model shared by answer validation and distractor ranking."""
+    sbert = SentenceTransformer(SBERT_MODEL_NAME, device=device)
+    sbert.max_seq_length = SBERT_MAX_SEQ_LENGTH
+    if sbert.device.type == "cuda":
+        sbert.half()  # FP16 halves bandwidth; cosine scores barely move for MiniLM
+    return sbert
+
+def inference_dtype(device: str) -> torch.dtype:
+    """T5 weight dtype: bf16 on Ampere+ (T5 overflows easily in fp16), fp16 on older GPUs, fp32 on CPU."""
+    if device != "cuda":
+        return torch.float32
+    return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+def compile_for_generation(model: AutoModelForSeq2SeqLM, tokenizer: AutoTokenizer, device: str) -> None:
+    """
+    On CUDA, compile the model's forward with torch.compile (default mode) and run one
+    warm-up generate() so the first request doesn't pay for compilation.
+    mode="reduce-overhead" is not used: with the dynamic KV cache it records a CUDA graph per
+    (batch, step) shape, and our micro-batch sizes vary. The eager forward is kept if
+    compilation is unavailable or fails, and generate_guarded() falls back to it at request time.
+    """
+    if device != "cuda" or not hasattr(torch, "compile"):
+        return
+    eager_forward = model.forward
+    try:
+        # generate() calls self.forward, so compile that rather than wrapping the module
+        model.forward = torch.compile(model.forward, fullgraph=False)
+        model._eager_forward = eager_forward
+        warm = tokenizer(["warm up"], return_tensors="pt").to(device)
+        with torch.inference_mode():
+            model.generate(warm["input_ids"], attention_mask=warm["attention_mask"], max_new_tokens=8,
+                           pad_token_id=tokenizer.pad_token_id, eos_token_id=tokenizer.eos_token_id)
+    except Exception as e:
+        log.debug("torch.compile failed, using eager model: %s", e)
+        model.forward = eager_forward
+        model._eager_forward = None
+
+def generate_guarded(model: AutoModelForSeq2SeqLM, **kwargs) -> torch.Tensor:
+    """
+    model.generate(**kwargs); if a compiled forward fails on a new shape at request time,
+    switch the model back to its eager forward for good and retry once.
+    """
+    try:
+        return model.generate(**kwargs)
+    except Exception as e:
+        eager_forward = getattr(model, "_eager_forward", None)
+        if eager_forward is None:
+            raise
+        log.debug("Compiled forward failed, reverting to eager: %s", e)
+        model.forward = eager_forward
+        model._eager_forward = None
+        return model.generate(**kwargs)
+
+def length_sorted_batches(tokenizer: AutoTokenizer, texts: List[str], batch_size: int, device: str):
+    """
+    Tokenize `texts` and yield (indices, padded inputs) micro-batches ordered by token length,
+    so each batch only pads to its own longest member. `indices` map rows back to `texts`.
+    """
+    enc = tokenizer(texts, max_length=512, truncation=True)
+    order = np.argsort([len(ids) for ids in enc["input_ids"]], kind="stable")
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        inputs = tokenizer.pad(
+            {"input_ids": [enc["input_ids"][i] for i in idx],
+             "attention_mask": [enc["attention_mask"][i] for i in idx]},
+            return_tensors="pt"
+        )
+        if device == "cuda":
+            # pinned host buffers let the H2D copy run asynchronously
+            inputs = {k: v.pin_memory().to(device, non_blocking=True) for k, v in inputs.items()}
+        else:
+            inputs = inputs.to(device)
+        yield idx, inputs
+
+# In-process LRU in front of the disk cache; rows live on CPU so VRAM does not grow
+EMBEDDING_LRU_SIZE = 4096
+_embedding_lru: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+_embedding_lru_lock = threading.Lock()
+
+def _lru_get(key: str) -> Optional[torch.Tensor]:
+    with _embedding_lru_lock:
+        emb = _embedding_lru.get(key)
+        if emb is not None:
+            _embedding_lru.move_to_end(key)
+        return emb
+
+def _lru_put(key: str, emb: torch.Tensor) -> None:
+    with _embedding_lru_lock:
+        _embedding_lru[key] = emb
+        _embedding_lru.move_to_end(key)
+        while len(_embedding_lru) > EMBEDDING_LRU_SIZE:
+            _embedding_lru.popitem(last=False)
+
+def encode_many_cached(sbert: SentenceTransformer, texts: List[str]) -> torch.Tensor:
+    """
+    SBERT-encode several strings (unit-normalized) as one batch.
+    Each string is looked up in memory, then on disk; only the misses are encoded.
+    Returns a [len(texts), dim] tensor in input order on the model's device.
+    """
+    # the model and its truncation length are part of the key, so the persistent cache never
+    # serves vectors from a different model (or dimension) after either changes
+    namespace = f"normalized:{SBERT_MODEL_NAME}:{sbert.max_seq_length}"
+    keys = [content_key(namespace, t) for t in texts]
+    rows = [_lru_get(k) for k in keys]
+    embedding_cache = disk_cache(".sbert_cache")
+    if embedding_cache is not None:
+        for i, row in enumerate(rows):
+            if row is None:
+                blob = embedding_cache.get(keys[i])
+                if blob is not None:
+                    rows[i] = torch.from_numpy(pickle.loads(blob))
+                    _lru_put(keys[i], rows[i])
+
+    misses = [i for i, row in enumerate(rows) if row is None]
+    if misses:
+        new_embs = sbert.encode([texts[i] for i in misses], batch_size=64, convert_to_tensor=True,
+                                normalize_embeddings=True, show_progress_bar=False).float().cpu()
+        for i, emb in zip(misses, new_embs):
+            # own the row's storage so the LRU doesn't pin the whole batch tensor
+            emb = emb.clone()
+            if embedding_cache is not None:
+                embedding_cache.set(keys[i], pickle.dumps(emb.numpy()))
+            _lru_put(keys[i], emb)
+            rows[i] = emb
+
+    # cache holds float32 on CPU; match the live model's device and dtype
+    batch = torch.stack(rows)
+    if sbert.device.type == "cuda":
+        batch = batch.pin_memory()
+    dtype = next(sbert.parameters()).dtype
+    return batch.to(sbert.device, dtype=dtype, non_blocking=True)
+
+def encode_cached(sbert: SentenceTransformer, text: str) -> torch.Tensor:
+    """SBERT-encode a single string (unit-normalized) through the embedding caches."""
+    return encode_many_cached(sbert, [text])[0]
+
+@lru_cache(maxsize=4096)
+def wordnet_lemma_names(word: str) -> Tuple[str, ...]:
+    """All WordNet lemma names (underscores as spaces) across the synsets of `word`, memoized."""
+    return tuple(lemma.name().replace("_", " ") for syn in wn.synsets(word) for lemma in syn.lemmas())
+
+def dedup_by(items: List[Any], key: Callable[[Any], Any]) -> List[Any]:
+    """Keep the first item for each distinct key, preserving order."""
+    out = {}
+    for it in items:
+        out.setdefault(key(it), it)
+    return list(out.values())
+
+# Drops punctuation in the same C-level pass as the character mapping
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation)
+
+def question_key(question: str) -> str:
+    """Dedup key for a question: casefolded, punctuation removed, whitespace collapsed."""
+    return " ".join(question.casefold().translate(_PUNCT_TABLE).split())
 
 def remove_duplicate_questions(mcqs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Remove MCQs with exact same question text."""
-    seen = set()
-    result = []
-    for m in mcqs:
-        q_lower = m["question"].strip().lower()
-        if q_lower not in seen:
-            result.append(m)
-            seen.add(q_lower)
-    return result
+    """Remove MCQs with the same question text (ignoring case, punctuation and spacing)."""
+    return dedup_by(mcqs, lambda m: question_key(m["question"]))
 
 def split_into_sentences(text: str) -> List[str]:
     """Split text into sentences using NLTK."""
-    return sent_tokenize(text)
+    return _punkt.tokenize(text)
+
+# (question pattern, answer pattern): reject the pair when both match.
+# Plain substring alternations, so each rule is one compiled scan per string.
+_TYPE_CHECK_RULES = [
+    # if question has "nationality" or "demonym", the answer must not be a city name or "Kathmandu"
+    (re.compile(r"nationality|demonym"),
+     re.compile(r"kathmandu|city|mount|beijing|capital|paris")),
+    # if question has "capital" or "city", we reject "nepali" or "hindu" etc.
+    (re.compile(r"capital|city"),
+     re.compile(r"nepali|himalayas|hindu|buddhist|french")),
+    # if question says "largest mountain" => answer shouldn't be "Nepali," etc.
+    (re.compile(r"largest mountain|tallest mountain"),
+     re.compile(r"nepali|kathmandu")),
+]
 
 def question_answer_type_check(question: str, answer: str) -> bool:
     """
@@ -57,34 +327,13 @@ def question_answer_type_check(question: str, answer: str) -> bool:
     For example:
       - if question says "nationality" or "demonym", we expect "Nepali" or "Nepalese" not "Kathmandu".
       - if question says "city" or "capital", we expect "Kathmandu" or "Paris" not "Nepali".
-    Expand as desired.
+    Expand as desired by adding to _TYPE_CHECK_RULES.
     """
     q_lower = question.lower()
     a_lower = answer.lower()
-
-    # Example rule: if question has "nationality" or "demonym",
-    # the answer must not be a city name or "Kathmandu".
-    if ("nationality" in q_lower or "demonym" in q_lower):
-        # If answer is "kathmandu" or "mount everest" we reject
-        city_keywords = ["kathmandu", "city", "mount", "beijing", "capital", "paris"]
-        for ck in city_keywords:
-            if ck in a_lower:
-                return False
-
-    # Another rule: if question has "capital" or "city", we reject "nepali" or "hindu" etc.
-    if ("capital" in q_lower or "city" in q_lower):
-        # If answer is "nepali" or "himalayas" => reject
-        nationality_keywords = ["nepali", "himalayas", "hindu", "buddhist", "french"]
-        for nk in nationality_keywords:
-            if nk in a_lower:
-                return False
-
-    # If question says "largest mountain" => answer shouldn't be "Nepali," etc.
-    if ("largest mountain" in q_lower or "tallest mountain" in q_lower):
-        # If answer is "nepali" or "kathmandu" => reject
-        if "nepali" in a_lower or "kathmandu" in a_lower:
+    for q_pattern, a_pattern in _TYPE_CHECK_RULES:
+        if q_pattern.search(q_lower) and a_pattern.search(a_lower):
             return False
-
     return True
 
 class AnswerValidator:
@@ -92,92 +341,154 @@ class AnswerValidator:
     Raises the threshold to 0.4 to ensure answers are more relevant.
     Also do a minimal type check if question has certain keywords.
     """
-    def __init__(self):
-        self.sbert = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, sbert: Optional[SentenceTransformer] = None):
+        self.sbert = sbert if sbert is not None else load_sbert()
         self.threshold = 0.05  # higher threshold than 0.15
 
-    def is_answer_plausible(self, question: str, answer: str, context: str) -> bool:
-        # Type-check rule first
-        if not question_answer_type_check(question, answer):
-            print(f"[DEBUG] Type-check failed: Q='{question}' => A='{answer}'")
-            return False
+    def is_answer_plausible(self, question: str, answer: str, context: str,
+                            ctx_emb: Optional[torch.Tensor] = None) -> bool:
+        """`ctx_emb` may be passed when the caller already holds the context embedding."""
+        return self.is_answer_plausible_batch([(question, answer, context)], [ctx_emb])[0]
 
-        if not answer.strip() or "could not parse" in answer.lower():
-            return False
+    def is_answer_plausible_batch(self, items: List[Tuple[str, str, str]],
+                                  ctx_embs: Optional[List[Optional[torch.Tensor]]] = None) -> List[bool]:
+        """
+        is_answer_plausible over (question, answer, context) triples. The cheap checks run per item;
+        answers that still need SBERT (plus any contexts without a supplied embedding) share one encode.
+        """
+        results = [False] * len(items)
+        pending = []
+        for i, (question, answer, context) in enumerate(items):
+            # Type-check rule first
+            if not question_answer_type_check(question, answer):
+                log.debug("Type-check failed: Q='%s' => A='%s'", question, answer)
+                continue
 
-        ans_emb = self.sbert.encode(answer, convert_to_tensor=True)
-        ctx_emb = self.sbert.encode(context, convert_to_tensor=True)
-        sim = float(util.cos_sim(ans_emb, ctx_emb)[0][0])
-        print(f"[DEBUG] SBERT check: answer='{answer}' sim={sim:.3f}, threshold={self.threshold}")
-        return sim >= self.threshold
+            if not answer.strip() or "could not parse" in answer.lower():
+                continue
+
+            # an answer lifted verbatim from its context is plausible; skip the SBERT pass
+            if answer.casefold() in context.casefold():
+                log.debug("Substring fast path: answer='%s'", answer)
+                results[i] = True
+                continue
+            pending.append(i)
+
+        if not pending:
+            return results
+        if ctx_embs is None:
+            ctx_embs = [None] * len(items)
+        missing = [i for i in pending if ctx_embs[i] is None]
+        embs = encode_many_cached(self.sbert, [items[i][1] for i in pending] + [items[i][2] for i in missing])
+        missing_rows = {i: embs[len(pending) + k] for k, i in enumerate(missing)}
+        ctx = torch.stack([missing_rows[i] if i in missing_rows else ctx_embs[i] for i in pending])
+        # embeddings are unit-length, so the row-wise dot product is the cosine similarity
+        sims = (embs[:len(pending)] * ctx).sum(dim=1).float().tolist()
+        for i, sim in zip(pending, sims):
+            log.debug("SBERT check: answer='%s' sim=%.3f, threshold=%s", items[i][1], sim, self.threshold)
+            results[i] = sim >= self.threshold
+        return results
 
 class DistractorGenerator:
     """
     T5 => if <3 => LLM => if <3 => sense2vec => if <3 => emergency
     + generats up to 5 T5 distractors to reduce fallback usage.
-    + retries LLM once if code=429 (ex: usage limit).
+    + retries the LLM up to LLM_MAX_ATTEMPTS times on 429 (ex: usage limit) / 500 / 502 / 503 / 504.
     """
 
-    def __init__(self, distractor_model_path: str, openrouter_api_key: str, device: str):
+    def __init__(self, distractor_model_path: str, openrouter_api_key: str, device: str,
+                 sbert: Optional[SentenceTransformer] = None, max_workers: int = 4):
         self.device = device
-        print(f"[DEBUG] Loading T5 distractor from: {os.path.abspath(distractor_model_path)}")
+        log.debug("Loading T5 distractor from: %s", os.path.abspath(distractor_model_path))
         self.dist_tokenizer = AutoTokenizer.from_pretrained(distractor_model_path)
-        self.dist_model = AutoModelForSeq2SeqLM.from_pretrained(distractor_model_path).to(self.device)
+        self.dtype = inference_dtype(self.device)
+        self.dist_model = AutoModelForSeq2SeqLM.from_pretrained(
+            distractor_model_path, torch_dtype=self.dtype
+        ).to(self.device)
+        self.dist_model.eval()
+        compile_for_generation(self.dist_model, self.dist_tokenizer, self.device)
         self.api_key = openrouter_api_key
-        self.sbert = SentenceTransformer("all-MiniLM-L6-v2")
-
-    def _generate_t5_distractors(self, question: str, correct: str, context: str) -> List[str]:
-        # We request up to 5 sequences
-        SEP_TOKEN = "<sep>"
-        input_text = f"{question}{SEP_TOKEN}{correct}{SEP_TOKEN}{context}"
-        inputs = self.dist_tokenizer([input_text],
-                                     return_tensors="pt",
-                                     max_length=512,
-                                     truncation=True,
-                                     padding=True).to(self.device)
-
-        with torch.no_grad():
-            # We generate up to 5 sequences
-            outputs = self.dist_model.generate(
-                inputs["input_ids"],
-                attention_mask=inputs["attention_mask"],
-                max_length=64,
-                do_sample=True,
-                top_k=50,
-                top_p=0.95,
-                temperature=1.0,
-                num_return_sequences=5
+        self.sbert = sbert if sbert is not None else load_sbert(self.device)
+        # caps in-flight LLM calls when MCQs are built concurrently
+        self._llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+        # one small, long-lived pool for the per-question cascade (not one per document)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="distractors")
+        # one pooled session so repeated LLM calls reuse the TLS connection; the adapter only
+        # retries failed connects (no sleep), where nothing was sent. Read errors/timeouts are not
+        # retried: the POST may already be running (and billed) upstream. Status retries and their
+        # backoff happen in _generate_llm_distractors, outside the concurrency slot
+        self._http = requests.Session()
+        self._http.mount("https://", HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=LLM_CONNECT_RETRIES,
+                connect=LLM_CONNECT_RETRIES,
+                read=0,
+                status=0,
+                other=0,
+                backoff_factor=0,
+                raise_on_status=False
             )
+        ))
+        self._http.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://mcq-generator.app",
+            "X-Title": "MCQ Generator",
+            "Content-Type": "application/json"
+        })
+
+    def _generate_t5_distractors_batch(self, triples: List[Tuple[str, str, str]]) -> List[List[str]]:
+        """
+        T5 distractor candidates for several (question, correct, context) triples,
+        tokenized together and decoded in length-sorted micro-batches. One list per triple.
+        """
+        input_texts = [f"{q}{SEP_TOKEN}{a}{SEP_TOKEN}{c}" for q, a, c in triples]
+        n = T5_DISTRACTOR_SEQUENCES
+        results = [[] for _ in input_texts]
+        for idx, inputs in length_sorted_batches(self.dist_tokenizer, input_texts,
+                                                 DISTRACTOR_MICRO_BATCH_SIZE, self.device):
+            with torch.inference_mode(), torch.autocast(self.device, dtype=self.dtype, enabled=self.device == "cuda"):
+                # 5-beam search, keeping every beam: 5 distinct sequences per input
+                outputs = generate_guarded(
+                    self.dist_model,
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_new_tokens=64,
+                    num_beams=n,
+                    do_sample=False,
+                    early_stopping=True,
+                    num_return_sequences=n,
+                    pad_token_id=self.dist_tokenizer.pad_token_id,
+                    eos_token_id=self.dist_tokenizer.eos_token_id
+                )
+            # outputs are [batch * n, L], grouped per input
+            decoded = self.dist_tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for row, i in enumerate(idx):
+                results[i] = self._parse_t5_candidates(decoded[row * n:(row + 1) * n])
+        return results
 
-        all_cands = []
-        for out in outputs:
-            decoded = self.dist_tokenizer.decode(out, skip_special_tokens=True)
-            partial = [d.strip() for d in decoded.split(SEP_TOKEN) if d.strip()]
-            all_cands.extend(partial)
-        # remove duplicates among T5 outputs
-        final = []
-        seen = set()
-        for c in all_cands:
-            cl = c.lower()
-            if cl not in seen:
-                final.append(c)
-                seen.add(cl)
-        print(f"[DEBUG] T5 raw distractor candidates={final}")
+    def _parse_t5_candidates(self, decoded: List[str]) -> List[str]:
+        # split, strip and dedup (case-insensitive, first wins) in one pass
+        seen = {}
+        for text in decoded:
+            for part in _SEP_RE.split(text):
+                part = part.strip()
+                if part:
+                    seen.setdefault(part.casefold(), part)
+        final = list(seen.values())
+        log.debug("T5 raw distractor candidates=%s", final)
         return final
 
-    def _generate_llm_distractors(self, correct: str, context: str, num_distractors: int, attempt=1) -> List[str]:
+    def _generate_llm_distractors(self, correct: str, context: str, num_distractors: int) -> List[str]:
         """
-        We'll do up to 2 attempts if we see a 429 error from the provider.
+        Up to LLM_MAX_ATTEMPTS attempts: LLM_RETRY_STATUSES responses (429, 500, 502, 503, 504)
+        are retried after 2s, 4s, ... without holding a concurrency slot while waiting.
+        Anything still failing falls back to emergency options.
         """
         if not self.api_key:
             return self._emergency_fallback(correct, context, num_distractors)
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "HTTP-Referer": "https://mcq-generator.app",
-            "X-Title": "MCQ Generator",
-            "Content-Type": "application/json"
-        }
         prompt = (
             f"Generate {num_distractors} plausible but incorrect multiple-choice answers where "
             f"'{correct}' is correct, from context '{context}'. Only a comma list, no extras."
@@ -188,57 +499,78 @@ class DistractorGenerator:
                 {"role": "user", "content": prompt}
             ]
         }
+        cache_key = content_key(correct, context, str(num_distractors))
+        llm_cache = disk_cache(".llm_cache")
+        if llm_cache is not None:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                log.debug("LLM response served from cache")
+                return self._distractors_from_llm_text(cached, correct, context, num_distractors)
+
         try:
-            resp = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, data=json.dumps(payload))
-            print(f"[DEBUG] LLM status={resp.status_code} text={resp.text[:200]}...")
+            for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+                with self._llm_slots:
+                    resp = self._http.post("https://openrouter.ai/api/v1/chat/completions",
+                                           json=payload, timeout=LLM_TIMEOUT)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("LLM status=%s text=%s...", resp.status_code, resp.text[:200])
+                if resp.status_code not in LLM_RETRY_STATUSES or attempt == LLM_MAX_ATTEMPTS:
+                    break
+                # back off 2s, 4s, ... with the slot released so other calls can proceed
+                delay = LLM_BACKOFF_BASE ** attempt
+                log.debug("LLM got %s => sleeping %ss and retrying", resp.status_code, delay)
+                time.sleep(delay)
 
             if resp.status_code == 200:
                 data = resp.json()
                 if "choices" not in data or not data["choices"]:
-                    print("[DEBUG] No 'choices' in LLM response => emergency fallback")
+                    log.debug("No 'choices' in LLM response => emergency fallback")
                     return self._emergency_fallback(correct, context, num_distractors)
                 text_out = data["choices"][0]["message"]["content"].strip()
-                cands = [x.strip() for x in text_out.split(",") if x.strip()]
-                cands = [re.sub(r'^\d+\.\s*', '', c) for c in cands]
-                filtered = self._filter_candidates(cands, correct, context)
-                if len(filtered) < num_distractors:
-                    needed = num_distractors - len(filtered)
-                    more = self._emergency_fallback(correct, context, needed)
-                    filtered.extend(more)
-                return filtered[:num_distractors]
+                if llm_cache is not None:
+                    llm_cache.set(cache_key, text_out)
+                return self._distractors_from_llm_text(text_out, correct, context, num_distractors)
             else:
-                # If 429 => wait 2 seconds, try again once
-                if resp.status_code == 429 and attempt < 2:
-                    print("[DEBUG] LLM got 429 => sleeping 2s and retrying once more.")
-                    time.sleep(2)
-                    return self._generate_llm_distractors(correct, context, num_distractors, attempt=2)
-
                 return self._emergency_fallback(correct, context, num_distractors)
 
         except Exception as e:
-            print(f"[DEBUG] LLM exception: {e}")
+            log.debug("LLM exception: %s", e)
             return self._emergency_fallback(correct, context, num_distractors)
 
+    def _distractors_from_llm_text(self, text_out: str, correct: str, context: str, num_distractors: int) -> List[str]:
+        """Parse the LLM's comma list, filter it, and top up with emergency options."""
+        cands = []
+        for part in text_out.split(","):
+            part = _NUM_PREFIX_RE.sub('', part.strip())
+            if part:
+                cands.append(part)
+        filtered = self._filter_candidates(cands, correct, context)
+        if len(filtered) < num_distractors:
+            needed = num_distractors - len(filtered)
+            more = self._emergency_fallback(correct, context, needed)
+            filtered.extend(more)
+        return filtered[:num_distractors]
+
     def _sense2vec_wordnet(self, correct: str, context: str, num: int) -> List[str]:
         cands = []
-        if s2v_available and correct.strip():
+        s2v = _get_s2v() if correct.strip() else None
+        if s2v is not None:
             tagged = correct + "|NOUN"
             try:
                 sim_list = s2v.most_similar(tagged, n=15)
                 for cc, sc in sim_list:
-                    c_text = cc.split("|")[0]
-                    if c_text.lower() != correct.lower():
-                        cands.append(c_text)
+                    cands.append(cc.split("|")[0])
             except:
                 pass
 
-        for syn in wn.synsets(correct):
-            for lemma in syn.lemmas():
-                lw = lemma.name().replace("_", " ")
-                if lw.lower() != correct.lower():
-                    cands.append(lw)
+        cands.extend(wordnet_lemma_names(correct))
 
-        final = self._re_rank_distractors(cands, correct, context, top_k=num)
+        # the same lemma recurs across synsets; drop repeats (and the answer) before embedding
+        correct_key = correct.casefold()
+        cands = dedup_by([c for c in cands if c.casefold() != correct_key], str.casefold)
+
+        context_emb = encode_cached(self.sbert, context)
+        final = self._re_rank_distractors(cands, correct, context, top_k=num, context_emb=context_emb)
         if len(final) < num:
             need = num - len(final)
             extra = self._emergency_fallback(correct, context, need)
@@ -256,46 +588,32 @@ class DistractorGenerator:
         return base[:num]
 
     def _filter_candidates(self, cands: List[str], correct: str, context: str) -> List[str]:
-        final = []
-        seen = set()
-        clower = correct.lower()
-        
-        # Normalize function to remove articles and standardize forms
-        def normalize(text):
-            # Remove leading articles
-            text = re.sub(r'^(a|an|the)\s+', '', text.lower())
-            # Lemmatize to handle plurals/singulars using spacy
-            doc = nlp(text)
-            lemmas = [token.lemma_ for token in doc]
-            return " ".join(lemmas)
+        # normalized form -> first candidate with that form (dicts keep insertion order)
+        kept = {}
+        clower = correct.casefold()
         
-        # Get normalized correct answer for comparison
-        normalized_correct = normalize(correct)
+        # Cheap string checks first: skip empty candidates and ones containing / contained in the answer
+        survivors = [c for c in cands
+                     if c.strip() and not (clower in (cf := c.casefold()) or cf in clower)]
+
+        # Normalize to remove articles and standardize forms: strip leading articles, then
+        # lemmatize (plurals/singulars) the answer and all survivors in one spaCy pass
+        texts = [_LEADING_ARTICLE_RE.sub('', t.casefold()) for t in [correct, *survivors]]
+        normalized = [" ".join(token.lemma_ for token in doc)
+                      for doc in nlp.pipe(texts, batch_size=64, disable=LEMMA_ONLY_DISABLE)]
+        normalized_correct = normalized[0]
         
-        for c in cands:
-            # Skip empty candidates
-            if not c.strip():
-                continue
-                
-            dlow = c.lower()
-            normalized_c = normalize(c)
-            
+        for c, normalized_c in zip(survivors, normalized[1:]):
             # Check if this is a duplicate or too similar to correct answer
-            if (normalized_c not in seen and 
+            if (normalized_c not in kept and
                 normalized_c != normalized_correct and
-                clower not in dlow and
-                dlow not in clower and
-                not self._is_minimal_variation(c, [correct] + final)):
-                
-                final.append(c)
-                seen.add(normalized_c)
+                not self._is_minimal_variation(c, [correct, *kept.values()])):
+                kept[normalized_c] = c
         
-        return final
+        return list(kept.values())
 
     def _is_minimal_variation(self, candidate: str, existing_items: List[str]) -> bool:
         """Check if candidate is just a minimal variation of existing items."""
-        import Levenshtein
-        
         # Normalize to lowercase for comparison
         candidate = candidate.lower()
         
@@ -311,7 +629,8 @@ class DistractorGenerator:
                     if max_len == 0:
                         continue
                         
-                    distance = Levenshtein.distance(item, candidate)
+                    # score_cutoff lets the DP bail out once the distance can no longer be < 20%
+                    distance = Levenshtein.distance(item, candidate, score_cutoff=int(0.2 * max_len))
                     normalized_distance = distance / max_len
                     
                     # If very similar (less than 20% different)
@@ -326,52 +645,48 @@ class DistractorGenerator:
                     
         return False
 
-    def _re_rank_distractors(self, cands: List[str], correct: str, context: str, top_k: int) -> List[str]:
+    def _re_rank_distractors(self, cands: List[str], correct: str, context: str, top_k: int,
+                             context_emb: Optional[torch.Tensor] = None) -> List[str]:
         if not cands:
             return []
-        correct_emb = self.sbert.encode(correct, convert_to_tensor=True)
-        context_emb = self.sbert.encode(context, convert_to_tensor=True)
-        c_embs = self.sbert.encode(cands, convert_to_tensor=True)
-
-        sim_ans = util.cos_sim(c_embs, correct_emb).squeeze(1)
-        sim_ctx = util.cos_sim(c_embs, context_emb).squeeze(1)
-
-        results = []
-        for i, cand in enumerate(cands):
-            ans_score = float(sim_ans[i])  # we want this small
-            ctx_score = float(sim_ctx[i])  # we want this large
-            final_score = ctx_score - ans_score
-            results.append((cand, final_score))
+        # one forward pass for the answer, the context (unless supplied) and every candidate
+        head = [correct] if context_emb is not None else [correct, context]
+        embs = encode_many_cached(self.sbert, head + cands)
+        correct_emb = embs[0]
+        if context_emb is None:
+            context_emb = embs[1]
+        c_embs = embs[len(head):]
 
-        results.sort(key=lambda x: x[1], reverse=True)
-        top = [r[0] for r in results[:top_k]]
-        return top
+        # one (N, 2) matmul: column 0 = similarity to context (want large), 1 = to answer (want small)
+        sims = c_embs @ torch.stack([context_emb, correct_emb], dim=1)
+        top = torch.topk(sims[:, 0] - sims[:, 1], k=min(top_k, len(cands))).indices
+        return [cands[i] for i in top.tolist()]
 
     def _filter_distractors(self, distractors: List[str], correct: str, question: str) -> List[str]:
         """Filter out low-quality distractors."""
-        filtered = []
+        if not distractors or not correct:
+            return []
         correct_lower = correct.lower()
-        
+
         # Check similarity using embeddings
-        correct_emb = self.sbert.encode(correct, convert_to_tensor=True)
-        dist_embs = self.sbert.encode(distractors, convert_to_tensor=True)
-        similarities = util.cos_sim(dist_embs, correct_emb)
-        
-        for i, dist in enumerate(distractors):
-            dist_lower = dist.lower()
-            sim = float(similarities[i])
-            
-            # Check if distractor is too similar or too different from correct answer
-            if 0.3 < sim < 0.85 and dist_lower != correct_lower:
-                # Check if distractor length is reasonable
-                if 0.3 < len(dist)/len(correct) < 3:
-                    filtered.append(dist)
-                    
-        return filtered
+        embs = encode_many_cached(self.sbert, [correct] + distractors)
+        sims = (embs[1:] @ embs[0]).float().cpu().numpy()
+
+        # Distractor must be neither too similar nor too different from the correct answer,
+        # and of a reasonable length relative to it
+        ratio = np.array([len(d) for d in distractors]) / len(correct)
+        mask = (sims > 0.3) & (sims < 0.85) & (ratio > 0.3) & (ratio < 3)
+        mask &= np.array([d.lower() != correct_lower for d in distractors])
 
-    def generate_distractors(self, question: str, correct_answer: str, context: str, num_distractors: int = 3) -> List[str]:
+        return [distractors[i] for i in np.nonzero(mask)[0]]
+
+    def generate_distractors(self, question: str, correct_answer: str, context: str, num_distractors: int = 3,
+                             context_emb: Optional[torch.Tensor] = None,
+                             t5_raw: Optional[List[str]] = None) -> List[str]:
+        """`t5_raw` may carry candidates already produced by _generate_t5_distractors_batch."""
         # 1) T5 local (with up to 5 sequences)
-        t5_raw = self._generate_t5_distractors(question, correct_answer, context)
+        if t5_raw is None:
+            t5_raw = self._generate_t5_distractors_batch([(question, correct_answer, context)])[0]
         filtered = self._filter_candidates(t5_raw, correct_answer, context)
         # If <3 => LLM
         if len(filtered) < num_distractors:
@@ -379,7 +694,8 @@ class DistractorGenerator:
             return llm
         else:
             # re-rank T5
-            final_t5 = self._re_rank_distractors(filtered, correct_answer, context, top_k=num_distractors)
+            final_t5 = self._re_rank_distractors(filtered, correct_answer, context, top_k=num_distractors,
+                                                 context_emb=context_emb)
             if len(final_t5) < num_distractors:
                 # fallback LLM
                 llm = self._generate_llm_distractors(correct_answer, context, num_distractors)
@@ -389,6 +705,26 @@ class DistractorGenerator:
                 return llm
             return final_t5
 
+    def generate_distractors_batch(self, triples: List[Tuple[str, str, str]], num_distractors: int = 3,
+                                   context_embs: Optional[List[torch.Tensor]] = None) -> List[List[str]]:
+        """
+        Distractors for several (question, correct, context) triples: one batched T5 pass,
+        then the per-question filter / re-rank / fallback cascade on a thread pool so
+        LLM round-trips overlap. Results are in input order.
+        """
+        if not triples:
+            return []
+        t5_raws = self._generate_t5_distractors_batch(triples)
+        if context_embs is None:
+            context_embs = [None] * len(triples)
+
+        def finish(i: int) -> List[str]:
+            question, correct, context = triples[i]
+            return self.generate_distractors(question, correct, context, num_distractors,
+                                             context_emb=context_embs[i], t5_raw=t5_raws[i])
+
+        return list(self._pool.map(finish, range(len(triples))))
+
 
 class MCQGenerator:
     """
@@ -408,39 +744,54 @@ class MCQGenerator:
                  qa_model_path: str = "./qa",
                  distractor_model_path: str = "./distractor",
                  openrouter_api_key: str = "",
-                 max_retries: int = 2):
+                 max_retries: int = 2,
+                 build_workers: int = 4):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
-        print(f"[DEBUG] Loading QA model from {os.path.abspath(qa_model_path)}")
+        log.debug("Loading QA model from %s", os.path.abspath(qa_model_path))
         self.qg_tokenizer = AutoTokenizer.from_pretrained(qa_model_path)
-        self.qg_model = AutoModelForSeq2SeqLM.from_pretrained(qa_model_path).to(self.device)
+        self.dtype = inference_dtype(self.device)
+        self.qg_model = AutoModelForSeq2SeqLM.from_pretrained(
+            qa_model_path, torch_dtype=self.dtype
+        ).to(self.device)
+        self.qg_model.config.use_cache = True
+        self.qg_model.eval()
+        compile_for_generation(self.qg_model, self.qg_tokenizer, self.device)
 
-        self.answer_validator = AnswerValidator()
-        self.distractor_gen = DistractorGenerator(distractor_model_path, openrouter_api_key, self.device)
+        # one SBERT instance shared by validation and distractor ranking
+        self.sbert = load_sbert(self.device)
+        self.answer_validator = AnswerValidator(sbert=self.sbert)
+        self.distractor_gen = DistractorGenerator(distractor_model_path, openrouter_api_key, self.device,
+                                                  sbert=self.sbert, max_workers=build_workers)
         self.max_retries = max_retries
 
-    # Q/A approach #1
-    def _generate_qa_masked(self, sentence: str) -> Dict[str, str]:
-        input_text = f"context: {sentence} answer: [MASK] </s>"
-        inputs = self.qg_tokenizer(
-            [input_text],
-            return_tensors="pt",
-            max_length=512,
-            truncation=True,
-            padding=True
-        ).to(self.device)
+    def _generate_qg_batch(self, prompts: List[str]) -> List[str]:
+        """
+        Run the QG model over several prompts; returns decoded strings in prompt order.
+        Prompts are length-sorted into micro-batches so each only pads to its own longest prompt.
+        """
+        decoded = [""] * len(prompts)
+        for idx, inputs in length_sorted_batches(self.qg_tokenizer, prompts, QG_MICRO_BATCH_SIZE, self.device):
+            with torch.inference_mode(), torch.autocast(self.device, dtype=self.dtype, enabled=self.device == "cuda"):
+                # short outputs: 4-beam search with the KV cache beats top-k/top-p sampling
+                outputs = generate_guarded(
+                    self.qg_model,
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_new_tokens=64,
+                    num_beams=4,
+                    do_sample=False,
+                    early_stopping=True,
+                    use_cache=True,
+                    pad_token_id=self.qg_tokenizer.pad_token_id,
+                    eos_token_id=self.qg_tokenizer.eos_token_id
+                )
+            for i, text in zip(idx, self.qg_tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                decoded[i] = text
+        return decoded
 
-        with torch.no_grad():
-            outputs = self.qg_model.generate(
-                inputs["input_ids"],
-                attention_mask=inputs["attention_mask"],
-                max_length=64,
-                do_sample=True,
-                top_k=50,
-                top_p=0.95,
-                temperature=1.0
-            )
-        decoded = self.qg_tokenizer.decode(outputs[0], skip_special_tokens=True)
+    def _parse_qa(self, decoded: str, fallback_answer: str = "Could not parse answer") -> Dict[str, str]:
+        """Split "question: ... answer: ..." model output into a Q/A dict."""
         if "question:" in decoded and "answer:" in decoded:
             try:
                 q_part, a_part = decoded.split("answer:")
@@ -449,50 +800,39 @@ class MCQGenerator:
                 return {"question": question, "answer": answer}
             except:
                 pass
-        return {"question": "Could not parse question", "answer": "Could not parse answer"}
+        return {"question": "Could not parse question", "answer": fallback_answer}
 
-    # Q/A approach #2
-    def _extract_key_phrase(self, sentence: str) -> str:
-        doc = nlp(sentence)
-        noun_chunks = list(doc.noun_chunks)
-        if not noun_chunks:
-            return ""
-        # pick longest
-        noun_chunks.sort(key=lambda c: len(c.text.split()), reverse=True)
-        return noun_chunks[0].text.strip()
-
-    def _generate_qa_keyphrase(self, sentence: str) -> Dict[str, str]:
-        keyp = self._extract_key_phrase(sentence)
-        if not keyp:
-            return {"question": "No key phrase found", "answer": "No key phrase found"}
-        input_text = f"context: {sentence} answer: {keyp} </s>"
-        inputs = self.qg_tokenizer(
-            [input_text],
-            return_tensors="pt",
-            max_length=512,
-            truncation=True,
-            padding=True
-        ).to(self.device)
-        with torch.no_grad():
-            outputs = self.qg_model.generate(
-                inputs["input_ids"],
-                attention_mask=inputs["attention_mask"],
-                max_length=64,
-                do_sample=True,
-                top_k=50,
-                top_p=0.95,
-                temperature=1.0
-            )
-        decoded = self.qg_tokenizer.decode(outputs[0], skip_special_tokens=True)
-        if "question:" in decoded and "answer:" in decoded:
-            try:
-                q_part, a_part = decoded.split("answer:")
-                question = q_part.replace("question:", "").strip()
-                answer = a_part.strip()
-                return {"question": question, "answer": answer}
-            except:
-                pass
-        return {"question": "Could not parse question", "answer": keyp}
+    def _longest_noun_chunk(self, doc) -> str:
+        # pick longest (in tokens) in one pass; first one wins on ties
+        longest = max(doc.noun_chunks, key=lambda c: c.end - c.start, default=None)
+        return longest.text.strip() if longest is not None else ""
+
+    def _generate_qas_batch(self, sentences: List[str]) -> List[Tuple[Dict[str, str], str]]:
+        """
+        Both Q/A approaches (masked answer, longest noun chunk as answer) for every sentence,
+        decoded in length-sorted micro-batches of QG_MICRO_BATCH_SIZE.
+        Returns (qa, sentence) pairs: masked then key phrase per sentence;
+        sentences without a noun chunk only get the masked variant.
+        """
+        docs = nlp.pipe(sentences, batch_size=16, disable=NOUN_CHUNK_DISABLE)
+        keyphrases = [self._longest_noun_chunk(doc) for doc in docs]
+
+        prompts, owners = [], []
+        for sent, keyp in zip(sentences, keyphrases):
+            prompts.append(f"context: {sent} answer: [MASK] </s>")
+            owners.append((sent, None))
+            if keyp:
+                prompts.append(f"context: {sent} answer: {keyp} </s>")
+                owners.append((sent, keyp))
+        if not prompts:
+            return []
+
+        decoded = self._generate_qg_batch(prompts)
+        results = []
+        for out, (sent, keyp) in zip(decoded, owners):
+            qa = self._parse_qa(out) if keyp is None else self._parse_qa(out, fallback_answer=keyp)
+            results.append((qa, sent))
+        return results
 
     def _generate_why_how_question(self, sentence: str) -> Dict[str, str]:
         """Generate why/how questions that test deeper understanding."""
@@ -508,71 +848,60 @@ class MCQGenerator:
                                   max_length=512, truncation=True).to(self.device)
         # Rest of generation code...
 
-    def _generate_qa_with_context(self, sentence: str, text: str) -> Dict[str, str]:
-        """Generate QA using the target sentence and surrounding context."""
-        sents = split_into_sentences(text)
-        try:
-            idx = sents.index(sentence)
+    def _generate_qa_with_context(self, sentence: str, sents: List[str], sent_idx: Dict[str, int]) -> Dict[str, str]:
+        """
+        Generate QA using the target sentence and surrounding context.
+        `sents` is the pre-split document and `sent_idx` maps each sentence to its position.
+        """
+        idx = sent_idx.get(sentence, -1)
+        if idx >= 0:
             start = max(0, idx - 1)
             end = min(len(sents), idx + 2)
             context = " ".join(sents[start:end])
-        except:
+        else:
             context = sentence
             
         # Now use this expanded context for generation
         input_text = f"context: {context} answer: [MASK] </s>"
         # Rest of your generation code...
 
-    def _validate_build_mcq(self, question: str, answer: str, context: str) -> Dict[str, Any]:
-        """
-        1) Check SBERT + type-check => if fail => dummy
-        2) If pass => generate distractors
-        3) combine => final MCQ
-        """
-        if not self.answer_validator.is_answer_plausible(question, answer, context):
-            return {
-                "question": "Could not generate valid question",
-                "correct_answer": "No valid answer",
-                "correct_option_index": 0,
-                "options": ["(1)", "(2)", "(3)", "(4)"]
-            }
-
-        # distractors
-        distractors = self.distractor_gen.generate_distractors(
-            question=question,
-            correct_answer=answer,
-            context=context,
-            num_distractors=3
-        )
+    def _invalid_mcq(self) -> Dict[str, Any]:
+        return {
+            "question": "Could not generate valid question",
+            "correct_answer": "No valid answer",
+            "correct_option_index": 0,
+            "options": ["(1)", "(2)", "(3)", "(4)"]
+        }
+
+    def _assemble_mcq(self, question: str, answer: str, distractors: List[str]) -> Dict[str, Any]:
         # remove duplicates
-        seen = set()
-        final_dist = []
-        for d in distractors:
-            dl = d.lower()
-            if dl not in seen and dl != answer.lower():
-                final_dist.append(d)
-                seen.add(dl)
+        answer_key = answer.casefold()
+        final_dist = dedup_by([d for d in distractors if d.casefold() != answer_key], str.casefold)
         if len(final_dist) < 3:
             final_dist += ["(No more distractors)"] * (3 - len(final_dist))
         final_dist = final_dist[:3]
 
-        options = [answer] + final_dist
+        # shuffle the distractors and drop the answer into a random slot: uniform over
+        # orderings, and the answer's index is known without searching for it
+        options = final_dist
         random.shuffle(options)
+        correct_index = random.randrange(len(options) + 1)
+        options.insert(correct_index, answer)
         return {
             "question": question,
             "correct_answer": answer,
-            "correct_option_index": options.index(answer),
+            "correct_option_index": correct_index,
             "options": options
         }
 
-    def _score_mcq(self, mcq: Dict[str, Any]) -> float:
-        """Enhanced scoring for better question selection."""
+    def _score_mcq(self, mcq: Dict[str, Any], q_doc: Optional[spacy.tokens.Doc] = None) -> float:
+        """Enhanced scoring for better question selection. `q_doc` may be the question's pre-parsed Doc."""
         score = 0
         question = mcq["question"]
         answer = mcq["correct_answer"]
         
         # Reward question words
-        if any(qw in question.lower() for qw in ["what", "why", "how", "which", "where", "when"]):
+        if _QUESTION_WORD_RE.search(question.lower()):
             score += 2
             
         # Reward non-trivial questions (longer than 6 words)
@@ -581,7 +910,8 @@ class MCQGenerator:
             score += 1
             
         # Reward questions with specific entities (names, places, etc.)
-        q_doc = nlp(question)
+        if q_doc is None:
+            q_doc = nlp(question, disable=NER_ONLY_DISABLE)
         if len(q_doc.ents) > 0:
             score += 2
             
@@ -596,39 +926,39 @@ class MCQGenerator:
             
         return float(score)
 
-    def _select_key_sentences(self, text: str, count: int) -> List[str]:
-        """Select important sentences based on multiple factors."""
-        sents = split_into_sentences(text)
+    def _select_key_sentences(self, sents: List[str], count: int,
+                              sent_embs: Optional[torch.Tensor] = None) -> List[str]:
+        """
+        Select important sentences (from an already split document) based on multiple factors.
+        `sent_embs` (normalized SBERT rows, one per sentence) adds closeness to the document's topic.
+        """
         if len(sents) <= count:
             return sents
             
-        # Calculate TF-IDF to identify important terms
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        vectorizer = TfidfVectorizer(stop_words='english')
-        try:
-            tfidf_matrix = vectorizer.fit_transform(sents)
-            importance_scores = tfidf_matrix.sum(axis=1).A1
-        except:
-            # Fallback to length-based if TF-IDF fails
-            importance_scores = [len(s.split()) for s in sents]
-        
+        # Term-weight each sentence; hashing skips building a vocabulary per document
+        tfidf_matrix = _TERM_VECTORIZER.transform(sents)
+        importance_scores = np.asarray(tfidf_matrix.sum(axis=1), dtype=float).ravel()
+
+        # Add up to 2 for sentences close to the document centroid (its overall topic)
+        if sent_embs is not None:
+            embs = sent_embs.float()
+            centroid = embs.mean(dim=0)
+            centroid = centroid / centroid.norm()
+            importance_scores += 2 * (embs @ centroid).cpu().numpy()
+
         # Add scores for sentences with named entities
-        for i, sent in enumerate(sents):
-            doc = nlp(sent)
-            if len(doc.ents) > 0:
+        for i, doc in enumerate(nlp.pipe(sents, batch_size=32, disable=NER_ONLY_DISABLE)):
+            if doc.ents:
                 importance_scores[i] += 2  # Bonus for sentences with entities
         
         # Add scores for sentences with key content markers
-        keywords = ["important", "significant", "key", "main", "crucial", "essential"]
         for i, sent in enumerate(sents):
-            if any(kw in sent.lower() for kw in keywords):
+            if _KEY_MARKER_RE.search(sent.lower()):
                 importance_scores[i] += 1
                 
-        # Get top sentences
-        top_indices = sorted(range(len(importance_scores)), 
-                            key=lambda i: importance_scores[i], 
-                            reverse=True)[:count*2]
-        top_indices.sort()  # Keep original order
+        # Get top sentences; stable so tied scores go to the earliest sentence
+        k = min(count * 2, len(sents))
+        top_indices = np.sort(np.argsort(-importance_scores, kind="stable")[:k])  # Keep original order
         return [sents[i] for i in top_indices]
 
     def _select_question_type(self, sentence, story_elements):
@@ -666,31 +996,53 @@ class MCQGenerator:
         4) remove duplicates
         5) re-rank => pick top user_requested_count
         """
-        # step1: pick top user_requested_count*2 sentences by length
-        sents = self._select_key_sentences(text, user_requested_count * 2)
-
-        mcqs = []
-        for sent in sents:
-            # approach 1: masked
-            qaA = self._generate_qa_masked(sent)
-            mcqA = self._validate_build_mcq(qaA["question"], qaA["answer"], sent)
-            mcqs.append(mcqA)
+        # step1: split once, embed every sentence in one batch (reused for selection
+        # and validation), then pick top user_requested_count*2 sentences
+        all_sents = split_into_sentences(text)
+        if not all_sents:
+            return []
+        sent_embs = encode_many_cached(self.sbert, all_sents)
+        sent_idx = {s: i for i, s in enumerate(all_sents)}
+        sents = self._select_key_sentences(all_sents, user_requested_count * 2, sent_embs=sent_embs)
 
-            # approach 2: key phrase
-            qaB = self._generate_qa_keyphrase(sent)
-            mcqB = self._validate_build_mcq(qaB["question"], qaB["answer"], sent)
-            mcqs.append(mcqB)
+        # step2: Q/A generation (GPU-bound), two approaches per sentence, batched.
+        # Keyed by question text so repeats never reach the distractor stage;
+        # another round covers the shortfall if duplicates eat into the margin.
+        target = user_requested_count * 3  # some margin
+        qas = {}
+        pending = list(sents)
+        while pending and len(qas) < target:
+            take = (target - len(qas) + 1) // 2
+            batch, pending = pending[:take], pending[take:]
+            for qa, sent in self._generate_qas_batch(batch):
+                qas.setdefault(question_key(qa["question"]), (qa, sent))
 
-            if len(mcqs) >= user_requested_count * 3:  # some margin
-                break
+        # step3: validate every QA, then generate distractors for all valid ones at once
+        # (one batched T5 pass; the LLM/sense2vec fallbacks overlap on a thread pool)
+        items = list(qas.values())
+        ctx_embs = [sent_embs[sent_idx[sent]] for _, sent in items]
+        plausible = self.answer_validator.is_answer_plausible_batch(
+            [(qa["question"], qa["answer"], sent) for qa, sent in items], ctx_embs
+        )
+        valid = [i for i, ok in enumerate(plausible) if ok]
+        distractor_lists = self.distractor_gen.generate_distractors_batch(
+            [(items[i][0]["question"], items[i][0]["answer"], items[i][1]) for i in valid],
+            num_distractors=3,
+            context_embs=[ctx_embs[i] for i in valid]
+        )
+        mcqs = [self._invalid_mcq()] * len(items)
+        for i, distractors in zip(valid, distractor_lists):
+            qa = items[i][0]
+            mcqs[i] = self._assemble_mcq(qa["question"], qa["answer"], distractors)
 
-        # remove duplicates by question
+        # remove duplicates by question (failed validations share one placeholder text)
         unique_mcqs = remove_duplicate_questions(mcqs)
 
-        # re-rank
+        # re-rank (questions go through NER in one batched pass)
+        q_docs = nlp.pipe([m["question"] for m in unique_mcqs], batch_size=64, disable=NER_ONLY_DISABLE)
         scored = []
-        for m in unique_mcqs:
-            s = self._score_mcq(m)
+        for m, q_doc in zip(unique_mcqs, q_docs):
+            s = self._score_mcq(m, q_doc=q_doc)
             scored.append((m, s))
         scored.sort(key=lambda x: x[1], reverse=True)
 
@@ -35,12 +35,73 @@ NUMBER_OF_QUESTIONS = 3
 QG_MODEL_DIR = "/media/saroj/New Volume/own/qa"
 DISTRACTOR_MODEL_DIR = "/media/saroj/New Volume/own/distractor"
 
+# Half precision on GPU (bf16 where supported), fp32 on CPU
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+if DEVICE == "cuda":
+    DTYPE = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+else:
+    DTYPE = torch.float32
+
+def load_model(model_dir):
+    """
+    Load a seq2seq model in DTYPE on DEVICE; on CUDA compile its forward (used by generate).
+    Default mode, not "reduce-overhead": CUDA graphs would be re-recorded for every new shape.
+    """
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_dir, torch_dtype=DTYPE).to(DEVICE).eval()
+    model.eager_forward = None
+    if DEVICE == "cuda" and hasattr(torch, "compile"):
+        try:
+            model.eager_forward = model.forward
+            model.forward = torch.compile(model.forward)
+        except Exception as e:
+            print(f"torch.compile unavailable, using eager model: {e}")
+            model.forward = model.eager_forward
+            model.eager_forward = None
+    return model
+
+def generate(model, **kwargs):
+    """model.generate(**kwargs), falling back to the eager forward if the compiled one fails."""
+    try:
+        return model.generate(**kwargs)
+    except Exception as e:
+        if model.eager_forward is None:
+            raise
+        print(f"Compiled model failed, retrying eagerly: {e}")
+        model.forward = model.eager_forward
+        model.eager_forward = None
+        return model.generate(**kwargs)
+
 ###############################################################################
 # 5) SETUP QUESTION GENERATION MODEL (Local T5-Base)
 ###############################################################################
 print("\nLoading Question Generation Model from local directory...")
 qg_tokenizer = AutoTokenizer.from_pretrained(QG_MODEL_DIR)
-qg_model = AutoModelForSeq2SeqLM.from_pretrained(QG_MODEL_DIR)
+qg_model = load_model(QG_MODEL_DIR)
+
+def generate_qas(context, num_sequences=1, answer="[MASK]", max_length=64,
+                 do_sample=True, top_k=50, top_p=0.95, temperature=1.0):
+    """
+    Samples `num_sequences` question/answer strings from one pass over the context:
+    the passage is tokenized and encoded once, and every sample decodes from that encoding.
+    Returns a list of strings in the format:
+        "question: <QUESTION> answer: <ANSWER>"
+    """
+    input_text = f"context: {context} answer: {answer} </s>"
+    inputs = qg_tokenizer([input_text], return_tensors="pt", truncation=True, padding=True).to(DEVICE)
+    
+    with torch.inference_mode(), torch.autocast(DEVICE, dtype=DTYPE, enabled=DEVICE == "cuda"):
+        outputs = generate(
+            qg_model,
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_length=max_length,
+            do_sample=do_sample,
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            num_return_sequences=num_sequences
+        )
+    return qg_tokenizer.batch_decode(outputs, skip_special_tokens=True)
 
 def generate_qa(context, answer="[MASK]", max_length=64,
                 do_sample=True, top_k=50, top_p=0.95, temperature=1.0):
@@ -49,27 +110,14 @@ def generate_qa(context, answer="[MASK]", max_length=64,
     Returns a string in the format:
         "question: <QUESTION> answer: <ANSWER>"
     """
-    input_text = f"context: {context} answer: {answer} </s>"
-    inputs = qg_tokenizer([input_text], return_tensors="pt", truncation=True, padding=True)
-    
-    outputs = qg_model.generate(
-        input_ids=inputs["input_ids"],
-        attention_mask=inputs["attention_mask"],
-        max_length=max_length,
-        do_sample=do_sample,
-        top_k=top_k,
-        top_p=top_p,
-        temperature=temperature,
-        num_return_sequences=1
-    )
-    return qg_tokenizer.decode(outputs[0], skip_special_tokens=True)
+    return generate_qas(context, 1, answer, max_length, do_sample, top_k, top_p, temperature)[0]
 
 ###############################################################################
 # 6) SETUP DISTRACTOR GENERATION MODEL (Local T5-Large)
 ###############################################################################
 print(f"Loading Distractor Generation Model from local directory...")
 dist_tokenizer = AutoTokenizer.from_pretrained(DISTRACTOR_MODEL_DIR)
-dist_model = AutoModelForSeq2SeqLM.from_pretrained(DISTRACTOR_MODEL_DIR)
+dist_model = load_model(DISTRACTOR_MODEL_DIR)
 
 SEP_TOKEN = "<sep>"
 
@@ -87,18 +135,20 @@ def generate_distractors(question, context, correct, max_length=64,
     Returns a list of strings [distractor1, distractor2, distractor3].
     """
     input_text = f"{question}{SEP_TOKEN}{correct}{SEP_TOKEN}{context}"
-    inputs = dist_tokenizer([input_text], return_tensors="pt", truncation=True, padding=True)
+    inputs = dist_tokenizer([input_text], return_tensors="pt", truncation=True, padding=True).to(DEVICE)
     
-    outputs = dist_model.generate(
-        input_ids=inputs["input_ids"],
-        attention_mask=inputs["attention_mask"],
-        max_length=max_length,
-        do_sample=do_sample,
-        top_k=top_k,
-        top_p=top_p,
-        temperature=temperature,
-        num_return_sequences=1
-    )
+    with torch.inference_mode(), torch.autocast(DEVICE, dtype=DTYPE, enabled=DEVICE == "cuda"):
+        outputs = generate(
+            dist_model,
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_length=max_length,
+            do_sample=do_sample,
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            num_return_sequences=1
+        )
     
     decoded = dist_tokenizer.decode(outputs[0], skip_special_tokens=True, clean_up_tokenization_spaces=True)
     distractors = [d.strip() for d in decoded.split(SEP_TOKEN)]
@@ -118,10 +168,10 @@ def main():
     print(f"Passage:\n{passage}\n")
     print(f"Generating {num_questions} MCQs...\n")
 
-    for i in range(num_questions):
-        # Step 1: Generate Q & A from the passage
-        qa_output = generate_qa(context=passage, answer="[MASK]")
-        
+    # Step 1: Generate all Q & A samples from one encoding of the passage
+    qa_outputs = generate_qas(context=passage, num_sequences=num_questions, answer="[MASK]")
+
+    for i, qa_output in enumerate(qa_outputs):
         # The model returns something like: "question: <Q> answer: <A>"
         if "question:" in qa_output and "answer:" in qa_output:
             try:
@@ -1,9 +1,18 @@
 # test_distractor_generator.py
-from distractor_generator import DistractorGenerator
+from concurrent.futures import ThreadPoolExecutor
+_GENERATOR = None
+
+def _generator():
+    """One DistractorGenerator per process; its models load on first use and are reused."""
+    global _GENERATOR
+    if _GENERATOR is None:
+        from distractor_generator import DistractorGenerator
+        _GENERATOR = DistractorGenerator()
+    return _GENERATOR
 
 def test_distractor_generation():
-    # Create an instance of the distractor generator
-    generator = DistractorGenerator()
+    # Shared instance of the distractor generator
+    generator = _generator()
     
     # Test cases with different types of correct answers and contexts
     test_cases = [
@@ -25,19 +34,24 @@ def test_distractor_generation():
         }
     ]
     
+    # The four cases are independent, so generate them concurrently and only
+    # iterate sequentially for printing
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        all_distractors = list(pool.map(
+            lambda case: generator.generate_best_distractors(
+                case["correct_answer"],
+                case["context"],
+                num_distractors=3
+            ),
+            test_cases
+        ))
+    
     # Run tests
-    for i, case in enumerate(test_cases):
+    for i, (case, distractors) in enumerate(zip(test_cases, all_distractors)):
         print(f"\n--- Test Case {i+1} ---")
         print(f"Correct Answer: {case['correct_answer']}")
         print(f"Context: {case['context']}")
         
-        # Generate distractors
-        distractors = generator.generate_best_distractors(
-            case["correct_answer"], 
-            case["context"],
-            num_distractors=3
-        )
-        
         print(f"Generated Distractors: {distractors}")
         
         # Check if we got actual distractors and not fallback options
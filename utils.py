@@ -1,109 +1,177 @@
 # utils.py
+import os
 import re
 import spacy
 import nltk
-from typing import List, Optional, Any
-from nltk.tokenize import sent_tokenize
+import threading
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Any, Tuple
+from nltk.tokenize import PunktTokenizer
 from nltk.corpus import wordnet as wn
 
 # Download necessary NLTK resources if not already available
 try:
-    nltk.data.find('tokenizers/punkt')
+    nltk.data.find('tokenizers/punkt_tab')
 except LookupError:
-    nltk.download('punkt')
+    nltk.download('punkt_tab')
 try:
     nltk.data.find('corpora/wordnet')
 except LookupError:
     nltk.download('wordnet')
 
-# Initialize spaCy model
-nlp = spacy.load("en_core_web_sm")
+@lru_cache(maxsize=None)
+def _get_punkt() -> PunktTokenizer:
+    """The English Punkt model sent_tokenize would use, built once instead of looked up per call."""
+    return PunktTokenizer("english")
+
+@lru_cache(maxsize=None)
+def _get_nlp():
+    """spaCy model, loaded on first use so importing utils stays cheap."""
+    return spacy.load("en_core_web_sm")
+
+# Sentence splitter: NLTK Punkt ("punkt", default) or spaCy's rule-based "sentencizer",
+# which is several times faster on long passages but knows fewer abbreviations
+SENTENCE_BACKEND = os.environ.get("MCQ_SENTENCE_BACKEND", "punkt")
+
+@lru_cache(maxsize=None)
+def _get_sentencizer():
+    sent_nlp = spacy.blank("en")
+    sent_nlp.add_pipe("sentencizer")
+    return sent_nlp
+
+# Memo of recent splits, bounded by the total characters of the cached texts (not by entry
+# count) so a long-running process never pins more than about this much document text
+SENTENCE_CACHE_MAX_CHARS = 1_000_000
+_sentence_cache = OrderedDict()
+_sentence_cache_chars = 0
+_sentence_cache_lock = threading.Lock()
+
+def _split(text: str) -> Tuple[str, ...]:
+    if SENTENCE_BACKEND == "sentencizer":
+        return tuple(s.text for s in _get_sentencizer()(text).sents)
+    return tuple(_get_punkt().tokenize(text))
+
+def _sentences_of(text: str) -> Tuple[str, ...]:
+    global _sentence_cache_chars
+    with _sentence_cache_lock:
+        hit = _sentence_cache.get(text)
+        if hit is not None:
+            _sentence_cache.move_to_end(text)
+            return hit
+    sents = _split(text)
+    if len(text) <= SENTENCE_CACHE_MAX_CHARS:
+        with _sentence_cache_lock:
+            if text not in _sentence_cache:
+                _sentence_cache[text] = sents
+                _sentence_cache_chars += len(text)
+                while _sentence_cache_chars > SENTENCE_CACHE_MAX_CHARS:
+                    old_text, _ = _sentence_cache.popitem(last=False)
+                    _sentence_cache_chars -= len(old_text)
+    return sents
 
 def split_into_sentences(text: str) -> List[str]:
-    """Split text into sentences."""
-    return sent_tokenize(text)
+    """Split text into sentences (memoized per text; callers get their own list)."""
+    return list(_sentences_of(text))
+
+def split_into_sentences_batch(texts: List[str]) -> List[List[str]]:
+    """Split several texts; with the sentencizer backend they stream through one nlp.pipe."""
+    if SENTENCE_BACKEND == "sentencizer":
+        return [[s.text for s in doc.sents] for doc in _get_sentencizer().pipe(texts, batch_size=64)]
+    return [split_into_sentences(text) for text in texts]
+
+_WORD_RE = re.compile(r"\S+")
 
 def pick_top_sentences(sentences: List[str], num: int = 3) -> List[str]:
     """
     Pick the most informative sentences for question generation.
     """
-    # Simple heuristic: longer sentences tend to have more information
+    # Simple heuristic: longer sentences tend to have more information.
+    # Word counts match len(s.split()) (any whitespace run separates words)
+    lens = np.fromiter((len(_WORD_RE.findall(s)) for s in sentences), dtype=np.int32, count=len(sentences))
     # Filter out very short sentences
-    filtered_sentences = [s for s in sentences if len(s.split()) > 5]
+    keep = np.flatnonzero(lens > 5)
     
     # If we don't have enough sentences after filtering, return all
-    if len(filtered_sentences) <= num:
-        return filtered_sentences
+    if len(keep) <= num:
+        return [sentences[i] for i in keep]
     
-    # Sort by length (word count) and return top 'num' sentences
-    return sorted(filtered_sentences, key=lambda s: len(s.split()), reverse=True)[:num]
+    # Sort by length (word count), longest first; stable so ties keep document order
+    top = keep[np.argsort(-lens[keep], kind="stable")[:num]]
+    return [sentences[i] for i in top]
+
+# Year/month/day words, four-digit years (like 1999), month names, "early 19th century" etc.,
+# unioned so one case-insensitive scan covers every pattern
+_TIME_RE = re.compile(
+    r'\b(?:year|month|day|decade|century|era)\b'
+    r'|\b\d{4}\b'
+    r'|\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\b'
+    r'|\b(?:early|late|mid)\s+\d{1,2}(?:st|nd|rd|th)\s+(?:century|decade)\b',
+    re.IGNORECASE
+)
 
 def is_time_phrase(text: str) -> bool:
     """Determine if the text is a time-related expression."""
-    time_patterns = [
-        r'\b(year|month|day|decade|century|era)\b',
-        r'\b\d{4}\b',  # Years like 1999
-        r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\b',
-        r'\b(early|late|mid)\s+\d{1,2}(st|nd|rd|th)\s+(century|decade)\b',
-    ]
-    for pattern in time_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            return True
-    return False
+    return _TIME_RE.search(text) is not None
+
+@lru_cache(maxsize=100_000)
+def _lemma(word: str) -> Optional[str]:
+    """Lemma of the word's first token (None for empty input); parser and NER are not needed."""
+    doc = _get_nlp()(word, disable=["parser", "ner"])
+    return doc[0].lemma_ if len(doc) else None
+
+@lru_cache(maxsize=50_000)
+def _lemma_set(word: str) -> frozenset:
+    """Lowercased lemma names across all of the word's WordNet synsets."""
+    return frozenset(lemma.name().lower() for syn in wn.synsets(word) for lemma in syn.lemmas())
 
 def is_synonym_or_lemma(word1: str, word2: str) -> bool:
     """Check if two words are synonyms or share the same lemma."""
+    return is_synonym_or_lemma_lower(word1.lower(), word2.lower())
+
+def is_synonym_or_lemma_lower(word1: str, word2: str) -> bool:
+    """is_synonym_or_lemma for already-lowercased words; the caches are keyed on the lowered form."""
     # Check if they're the same word
-    if word1.lower() == word2.lower():
+    if word1 == word2:
         return True
     
     # Check lemmas
-    doc1 = nlp(word1)
-    doc2 = nlp(word2)
-    if doc1 and doc2 and doc1[0].lemma_ == doc2[0].lemma_:
+    lemma1 = _lemma(word1)
+    if lemma1 is not None and lemma1 == _lemma(word2):
         return True
     
-    # Check WordNet synonyms
-    synsets1 = wn.synsets(word1)
-    synsets2 = wn.synsets(word2)
-    for syn1 in synsets1:
-        for syn2 in synsets2:
-            if syn1 == syn2:
-                return True
-            
-    # Check lemmas in synsets
-    lemmas1 = set()
-    lemmas2 = set()
-    
-    for syn in synsets1:
-        for lemma in syn.lemmas():
-            lemmas1.add(lemma.name().lower())
-    
-    for syn in synsets2:
-        for lemma in syn.lemmas():
-            lemmas2.add(lemma.name().lower())
-    
-    return bool(lemmas1.intersection(lemmas2))
+    # Check WordNet synonyms: a shared synset implies shared lemma names,
+    # so one set-disjointness test covers both checks
+    lemmas1 = _lemma_set(word1)
+    return bool(lemmas1) and not lemmas1.isdisjoint(_lemma_set(word2))
 
 def is_partial_match(short_text: str, long_text: str) -> bool:
     """Check if the shorter text is a part of the longer text."""
-    return short_text.lower() in long_text.lower()
+    return is_partial_match_lower(short_text.lower(), long_text.lower())
+
+def is_partial_match_lower(short_lower: str, long_lower: str) -> bool:
+    """is_partial_match for already-lowercased inputs, so a loop over many candidates
+    against one context can lowercase the context once."""
+    return short_lower in long_lower
+
+# spaCy coarse POS -> WordNet POS; proper nouns map to WordNet nouns too
+_WORDNET_POS = {
+    "NOUN": wn.NOUN,
+    "PROPN": wn.NOUN,
+    "VERB": wn.VERB,
+    "ADJ": wn.ADJ,
+    "ADV": wn.ADV,
+}
 
 def spacy_pos_to_wordnet_pos(spacy_pos: str) -> Optional[str]:
     """Convert spaCy POS tags to WordNet POS tags."""
-    if spacy_pos.startswith('NOUN'):
-        return wn.NOUN
-    elif spacy_pos.startswith('VERB'):
-        return wn.VERB
-    elif spacy_pos.startswith('ADJ'):
-        return wn.ADJ
-    elif spacy_pos.startswith('ADV'):
-        return wn.ADV
-    return None
+    return _WORDNET_POS.get(spacy_pos)
 
+@lru_cache(maxsize=50_000)
 def extract_main_token(phrase: str) -> Optional[str]:
     """Extract the main token (head word) from a phrase."""
-    doc = nlp(phrase)
+    doc = _get_nlp()(phrase)
     if len(doc) == 0:
         return None
     
@@ -111,15 +179,12 @@ def extract_main_token(phrase: str) -> Optional[str]:
     if len(doc) == 1:
         return doc[0].text
     
-    # Find the root of the phrase
+    # One pass: the root of the phrase wins; if no root found, the last noun,
+    # and by default the last token
+    last_noun = None
     for token in doc:
         if token.dep_ == "ROOT":
             return token.text
-    
-    # If no root found, return the last noun or the last token
-    for token in reversed(doc):
         if token.pos_ == "NOUN":
-            return token.text
-    
-    # Default to last token
-    return doc[-1].text
+            last_noun = token
+    return (last_noun or doc[-1]).text